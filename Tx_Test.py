@@ -9,7 +9,7 @@ print(MESSAGE)
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP
 while True:
-    x = raw_input("Message to send:")
+    x = input("Message to send:")
     MESSAGE = x
-    sock.sendto(MESSAGE, (UDP_IP, UDP_PORT))
+    sock.sendto(MESSAGE.encode(), (UDP_IP, UDP_PORT))
     time.sleep(5)
@@ -1,18 +1,59 @@
 #System Imports
+import os
 import socket
+import concurrent.futures
 import time
 import threading
-import select
-import json
 import struct
-import re
 import sys
-from Queue import *
 #3rd Party Imports
 import serial
 #Local Imports
 from PowerControl import *
-from khanda_structs import *
+from khanda_structs import khanda_message,khanda_TxWrapper,khanda_BoundedQueue,KhandaMSGDumps
+from khanda_mmsg import khanda_RxBatch,khanda_TxBatch
+from khanda_decode import DEFAULT_MCAST_GRP,clean_packet,decode_packet
+
+RX_BATCH = 32
+TX_BATCH = 32
+TX_SNDBUF = 1024 * 1024
+RX_RCVBUF = 8 * 1024 * 1024
+QUEUE_MAXSIZE = 1024
+LOG_BUFSIZE = 64 * 1024
+LOG_FLUSH_INTERVAL = 1.0
+RX_PRIORITY = 10
+IP_MULTICAST_ALL = getattr(socket,"IP_MULTICAST_ALL",49) #Linux only, missing from older socket modules
+#Address LED responses are sent to
+LED_RESP_IP = "10.0.0.120"
+#LED event payload -> LED command sent back to the device
+LED_CMDS = {"RED" : "LED+RED", "REDOFF" : "LED+RED",
+            "GREEN" : "LED+GREEN", "GREENOFF" : "LED+GREEN",
+            "BLUE" : "LED+BLUE", "BLUEOFF" : "LED+BLUE"}
+#Response timestamp format, time.time() is read once per response and formatted with this
+TIMESTAMP_FMT = "%.6f"
+#Serialized LED responses, only the timestamp is filled in per packet
+_LED_RESP = dict((payload,KhandaMSGDumps(khanda_message("CMD",cmd,DEFAULT_MCAST_GRP,TIMESTAMP_FMT)))
+                 for payload,cmd in LED_CMDS.items())
+
+def parse_cpulist(cpulist):
+    """Parses a sysfs cpulist string ("0-3,8-11") into a set of CPU numbers
+    Args:
+        cpulist: string, contents of a sysfs cpulist file
+    Returns:
+        set of int CPU numbers
+    Raises:
+        ValueError if the list is malformed
+    """
+    cpus = set()
+    for span in cpulist.strip().split(","):
+        if not span:
+            continue
+        if "-" in span:
+            first,last = span.split("-")
+            cpus.update(range(int(first),int(last) + 1))
+        else:
+            cpus.add(int(span))
+    return cpus
 
 class khandaServer:
     """
@@ -20,62 +61,89 @@ class khandaServer:
 
     Attributes:
         MSGLEN (int): packet message size in bytes
-        RxQueue (Queue): Queue containing decoded packets from serial and UDP port
-        TxQueue (Queue): Queue containing serialized packets to be sent
-        CmdQueue (Queue): Queue containing khanda_message objects to be parsed
+        RxQueue (khanda_BoundedQueue): Queue containing decoded packets from serial and UDP port, receivers block while it is full
+        TxQueue (khanda_BoundedQueue): Queue containing serialized packets to be sent, producers block while it is full
         threads (thread list): list of current running threads
         serialPorts (serial list): list of currently opened serial ports
         globalTimeWatchdog (int): timer watchdog for device communications
         port (int): UDP port number, default 5007
         host (string): UDP port address, default 224.1.1.1
         sock (socket): UDP socket object
-        logfile (FILE): Output logfile
+        nic_iface (string): receiving network interface, RxWorker is pinned to CPUs local to it (Linux only)
+        logfile (FILE): Output logfile, opened in binary mode with a LOG_BUFSIZE buffer flushed every LOG_FLUSH_INTERVAL seconds
         PSU_PORT (string): address of power supply serial port
         PSU_DEV (PSU_Device): PSU_Device object that gives user access to power control if attached
-        Attached_Devices (2D-String array): Device & IP pairs of devices communicating with system
+        Attached_Devices (dict): IP -> Device type of devices communicating with system, re-registration replaces the entry
+        _shutdown (Event): set by stopWorkers to tell worker loops to exit
+        cmdPool (ProcessPoolExecutor): process pool running the custom command parser, None unless CMDProcesses is given
+        _cmdSlots (BoundedSemaphore): limits packets in flight in cmdPool
+        _rxBatch (khanda_RxBatch): preallocated recvmmsg buffers used by RxWorker
+        _txBatch (khanda_TxBatch): preallocated sendmmsg headers used by TxWorker
+        _addr_cache (dict): recipient IP -> (IP,port) destination tuple, reused for every packet to that recipient
     Methods:
         __init__: Creates khanda_server object and Initializes Attributes
         serial_start: creates serial port connection
         connect: binds UDP socket
         startWorkers: starts all worker functions in seperate threads
         stopWorkers: stops all currently running worker threads
+        serveForever: starts the workers and blocks the caller until interrupted
         set_MSGLEN: set packet data size
         QueueCommand: Place command in TxQueue
-        SerialRxWorker: Worker thread for retrieving data from serial ports, placed in RxQueue
+        QueuePacket: Decode a cleaned packet and place it in RxQueue
+        SerialRxWorker: Worker thread (one per port) for retrieving data from a serial port, placed in RxQueue
         RxWorker: Worker thread for retrieving data from the UDP socket, placed in RxQueue
+        pinRxThread: Pin the calling thread to the NIC's NUMA-local CPUs and give it real-time priority
         TxWorker: Worker thread for transmitting data contained in the TxQueue
+        _addr: Return the cached (IP,port) destination for a recipient
         CMDWorker: Worker thread for parsing data from the RxQueue
+        CMDPoolWorker: Worker thread for handing data from the RxQueue to the custom parser in cmdPool
+        _queueParserResult: cmdPool completion callback, places the parser response in TxQueue
+        _handleEvent,_handleLED,_handleHealth,_handleDevice: Default parser handlers, dispatched by packet type through _handlers
+        LogPacket: Append a packet to the logfile buffer
+        LogFlushWorker: Worker thread that periodically flushes the logfile buffer to disk
         attach_PSU: Add PSU device to system and open serial port
         detach_PSU: Remove and Close PSU Device object and serial port
     """
-    def __init__(self,MCAST_GRP=None,MCAST_PORT=None,sock=None):
+    def __init__(self,MCAST_GRP=None,MCAST_PORT=None,sock=None,nic_iface=None):
         """Intialize the KhandaServer Object.
         Args:
             MCAST_GRP: Slave device multicast group
             MCAST_PORT: Port for server to listen on
             sock: socket object to use, default value generates socket object
+            nic_iface: name of the receiving network interface (eth0), if given RxWorker is pinned to its local CPUs
         """
+        self.nic_iface = nic_iface
         self.MSGLEN = 512
-        self.RxQueue =  Queue()
-        self.TxQueue =  Queue()
-        self.CmdQueue = Queue()
+        self.RxQueue =  khanda_BoundedQueue(QUEUE_MAXSIZE)
+        self.TxQueue =  khanda_BoundedQueue(QUEUE_MAXSIZE)
         self.threads = []
         self.serialPorts = []
         self.globalTimeWatchdog = 0
         self.PSU_PORT = None
         self.PSU_DEV = None
-        self.Attached_Devices = []
+        self.Attached_Devices = {}
+        self._shutdown = threading.Event()
+        self.cmdPool = None
+        self._cmdSlots = None
+        self.logfile = open("logfile.txt","ab",buffering=LOG_BUFSIZE)
         if MCAST_PORT is None:
             self.port = 5007
         else:
             self.port = MCAST_PORT
         if MCAST_GRP is None:
-            self.host = "224.1.1.1"
+            self.host = DEFAULT_MCAST_GRP
         else:
             self.host = MCAST_GRP
         if sock is None:
             self.sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM,socket.IPPROTO_UDP)
             self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        else:
+            self.sock = sock
+        self._rxBatch = khanda_RxBatch(self.sock,RX_BATCH,self.MSGLEN)
+        self._txBatch = khanda_TxBatch(self.sock,TX_BATCH)
+        self._addr_cache = {}
+        for ip in (self.host,DEFAULT_MCAST_GRP,LED_RESP_IP):
+            self._addr(ip)
 
 
 
@@ -93,7 +161,7 @@ class khandaServer:
             self.PSU_PORT = serial.Serial(SERIAL_PORT,9600,timeout=1)
             self.PSU_DEV = PSU_Device(self.PSU_PORT)
             return 0
-        except:
+        except Exception:
             sys.stderr.write("Error Opening PSU Port!")
             return -1
 
@@ -117,7 +185,7 @@ class khandaServer:
                 self.PSU_PORT.close()
                 self.PSU_DEV = None
                 return 0
-            except:
+            except Exception:
                 sys.stderr.write("Error Closing PSU Port!")
                 return -2
 
@@ -132,13 +200,26 @@ class khandaServer:
             Error if serial parameters are invalid
         """
         try:
-            port = serial.Serial(SERIAL_PORT,BAUD,timeout=1)
+            #No read timeout, SerialRxWorker sleeps until a line arrives and stopWorkers wakes it with cancel_read
+            port = serial.Serial(SERIAL_PORT,BAUD,timeout=None)
+            #Ask the driver (FTDI etc.) to hand bytes over immediately instead of batching them (Linux only)
+            if hasattr(port,"set_low_latency_mode"):
+                try:
+                    port.set_low_latency_mode(True)
+                except (OSError,ValueError):
+                    sys.stderr.write("Unable to set serial low latency mode")
             self.serialPorts.append(port)
-        except:
+        except Exception:
             sys.stderr.write("Invalid Serial port parameters")
 
     def connect(self):
         """Binds Khanda Server to UDP socket and listens
+        On Linux the kernel clamps SO_RCVBUF to net.core.rmem_max and may drop multicast on the reverse path filter,
+        to capture bursts without loss raise the limits on the host:
+            sysctl -w net.core.rmem_max=16777216
+            sysctl -w net.core.netdev_max_backlog=5000
+            sysctl -w net.ipv4.conf.all.rp_filter=0
+            sysctl -w net.ipv4.conf.<iface>.rp_filter=0
         Args:
             Self
         Returns:
@@ -147,17 +228,30 @@ class khandaServer:
             Network Error if connection fails
         """
         try:
+            #RxWorker blocks in the receive call itself rather than polling
+            self.sock.settimeout(None)
+            if hasattr(socket,"SO_REUSEPORT"):
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RX_RCVBUF)
             self.sock.bind(('',self.port))
             mreq = struct.pack("4sl", socket.inet_aton(self.host), socket.INADDR_ANY)
             self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        except:
+            #Only deliver groups joined on this socket and never our own multicast sends
+            if sys.platform.startswith("linux"):
+                self.sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 0)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TX_SNDBUF)
+        except Exception:
             sys.stderr.write("Error Binding Socket!")
 
 
-    def startWorkers(self,CMDParser = None):
-        """Starts worker threads (Network Transmit,Network Receive,Command Worker,Serial Recieve)
+    def startWorkers(self,CMDParser = None,CMDProcesses = 0):
+        """Starts worker threads (Network Transmit,Network Receive,Log Flush,Command Worker,Serial Recieve)
         Args:
             CMDParser (function): Custom command parser function, if not specified run default parser
+            CMDProcesses (int): run CMDParser in a pool of this many processes instead of the CMDWorker thread, so
+                                CPU-bound parsers are not serialized by the GIL. CMDParser must be a module-level function
+                                and responses may be queued out of order. Default: 0, parse in the CMDWorker thread
         Returns:
             None
         Raises:
@@ -170,21 +264,29 @@ class khandaServer:
             t = threading.Thread(target=self.TxWorker)
             self.threads.append(t)
             t.start()
+            t = threading.Thread(target=self.LogFlushWorker)
+            self.threads.append(t)
+            t.start()
             if CMDParser is None:
                 t = threading.Thread(target=self.CMDWorker)
                 self.threads.append(t)
                 t.start()
+            elif CMDProcesses:
+                self.cmdPool = concurrent.futures.ProcessPoolExecutor(max_workers=CMDProcesses)
+                #Bound the packets in flight so a slow pool pushes back on RxQueue instead of buffering without limit
+                self._cmdSlots = threading.BoundedSemaphore(2 * CMDProcesses)
+                t = threading.Thread(target=self.CMDPoolWorker,args=(CMDParser,))
+                self.threads.append(t)
+                t.start()
             else:
-                t = threading.Thread(target=self.CMDWorker,args=(CMDParser))
+                t = threading.Thread(target=self.CMDWorker,args=(CMDParser,))
                 self.threads.append(t)
                 t.start()
-            if len(self.serialPorts):
-                t = threading.Thread(target=self.SerialRxWorker)
+            for port in self.serialPorts:
+                t = threading.Thread(target=self.SerialRxWorker,args=(port,))
                 self.threads.append(t)
                 t.start()
-            else:
-                continue
-        except:
+        except Exception:
             sys.stderr.write("Unable to start worker threads!")
 
 
@@ -199,17 +301,54 @@ class khandaServer:
             System Error if logfile cannot be closed
         """
         try:
+            self._shutdown.set()
+            #Release producers blocked on full queues, then wake the workers blocked on the queues and the socket
+            self.RxQueue.close()
+            self.TxQueue.close()
+            self.RxQueue.put(None)
+            self.TxQueue.put(None)
+            #shutdown wakes a blocked receive on Linux, closing the socket is what wakes it on Windows
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.sock.close()
+            for port in self.serialPorts:
+                port.cancel_read()
             for worker in self.threads:
-                worker.stop()
+                worker.join()
+            self.threads = []
+            if self.cmdPool is not None:
+                self.cmdPool.shutdown(wait=True)
+                self.cmdPool = None
             for port in self.serialPorts:
                 port.close()
-        except:
+        except Exception:
             sys.stderr.write("Unable to stop working threads!")
         try:
             self.logfile.close()
-        except:
+        except Exception:
             sys.stderr.write("Unable to close logfile!")
 
+    def serveForever(self,CMDParser=None,CMDProcesses=0):
+        """Starts the worker threads and parks the calling thread until stopWorkers runs or Ctrl-C is pressed
+        The caller sleeps on the shutdown event instead of spinning, so an idle server uses no CPU
+        Args:
+            CMDParser (function): Custom command parser function, if not specified run default parser
+            CMDProcesses (int): number of processes to run CMDParser in, see startWorkers. Default: 0
+        Returns:
+            None
+        Raises:
+            None
+        """
+        self.startWorkers(CMDParser,CMDProcesses)
+        try:
+            #Timed wait so Ctrl-C is still delivered on Windows
+            while not self._shutdown.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self.stopWorkers()
+
     def set_MSGLEN(self,length):
         """Sets message length for khanda packets
         Args:
@@ -220,6 +359,7 @@ class khandaServer:
             None
         """
         self.MSGLEN = length
+        self._rxBatch = khanda_RxBatch(self.sock,RX_BATCH,self.MSGLEN)
 
     def QueueCommand(self,CMD):
         """Place command in the Tx Queue of the khanda server
@@ -232,79 +372,108 @@ class khandaServer:
             Error if command is unable to be processed
         """
         try:
-            newCommand = khanda_message("CMD",CMD,"224.1.1.1","1") #Placeholder Timestamp
-            newCommand_wrapper = khanda_TxWrapper("224.1.1.1",json.dumps(khanda_Resp,cls=JSONEncoder))
+            newCommand = khanda_message("CMD",CMD,DEFAULT_MCAST_GRP,"1") #Placeholder Timestamp
+            newCommand_wrapper = khanda_TxWrapper(DEFAULT_MCAST_GRP,KhandaMSGDumps(newCommand))
             self.TxQueue.put(newCommand_wrapper)
             return 0
-        except:
+        except Exception:
             sys.stderr.write("Unable to Process Command")
             return -1
 
-    def SerialRxWorker(self):
-        """Worker thread function that retrieves data from serial devices,places decoded JSON object into RxQueue
+    def QueuePacket(self,raw_khanda_packet):
+        """Decodes a packet returned by clean_packet on the receiving thread, places khanda_message objects addressed to the server into RxQueue
         Args:
+            raw_khanda_packet : bytes, cleaned packet
+        Returns:
             None
+        Raises:
+            Error if packet data is not in proper JSON format
+        """
+        try:
+            khanda_packet = decode_packet(raw_khanda_packet)
+            if khanda_packet is not None:
+                self.RxQueue.put(khanda_packet)
+        except Exception:
+            sys.stderr.write("Invalid Packet Structure")
+
+    def SerialRxWorker(self,port):
+        """Worker thread function that retrieves data from one serial device, places decoded JSON object into RxQueue
+        Args:
+            port : Serial, opened serial port to read from, one thread runs per port
         Returns:
             None
         Raises:
-            Error if serial data is not in proper JSON format
+            None
         """
-        while True:
-            for port in self.serialPorts:
-                if port.in_waiting >= 128:
-                    try:
-                        raw_khanda_packet = port.readline()
-                        re.sub(r"\s+$","",raw_khanda_packet)
-                        raw_khanda_packet = raw_khanda_packet.replace('\t','')
-                        raw_khanda_packet = raw_khanda_packet.replace('\r','')
-                        raw_khanda_packet = raw_khanda_packet.replace('\n','')
-                        raw_khanda_packet = raw_khanda_packet.replace('\0','')
-                        raw_khanda_packet = raw_khanda_packet.replace('\'','\"')
-                        if raw_khanda_packet:
-                            print(str(raw_khanda_packet))
-                        try:
-                            khanda_packet = json.loads(raw_khanda_packet,object_hook=KhandaMSGDecoder,strict=False)
-                            if khanda_packet.recipient == "224.1.1.1": # and khanda_packet.timestamp == 1:
-                                self.RxQueue.put(khanda_packet)
-                            else:
-                                del khanda_packet
-                        except:
-                            sys.stderr.write("Invalid Packet Structure")
-                    except:
-                        return
+        while not self._shutdown.is_set():
+            try:
+                raw_khanda_packet = clean_packet(port.read_until(b'\n'))
+                if raw_khanda_packet:
+                    print(str(raw_khanda_packet))
+                    self.QueuePacket(raw_khanda_packet)
+            except Exception:
+                return
 
     def RxWorker(self):
-        """Worker thread function that retrieves data from UDP port, places decoded JSON object into RxQueue
+        """Worker thread function that retrieves batches of up to RX_BATCH datagrams from UDP port, places decoded JSON object into RxQueue
         Args:
             None
         Returns:
             None
         Raises:
-            Error if Network data is not in proper JSON format
+            None
         """
-        while True:
-            readable = [self.sock]
-            read,write,exception = select.select(readable,[],[],0)
-            for readable_socket in read:
-                raw_khanda_packet = readable_socket.recv(512)
-                re.sub(r"\s+$","",raw_khanda_packet)
-                raw_khanda_packet = raw_khanda_packet.replace('\t','')
-                raw_khanda_packet = raw_khanda_packet.replace('\r','')
-                raw_khanda_packet = raw_khanda_packet.replace('\n','')
-                raw_khanda_packet = raw_khanda_packet.replace('\0','')
-                print(raw_khanda_packet)
-                try:
-                    khanda_packet = json.loads(raw_khanda_packet,object_hook=KhandaMSGDecoder,strict=False)
-                    if khanda_packet.recipient == "224.1.1.1": # and khanda_packet.timestamp == 1:
-                        self.RxQueue.put(khanda_packet)
-                    else:
-                        del khanda_packet
-                except:
-                    sys.stderr.write("Invalid Packet Structure")
-            continue
+        self.pinRxThread()
+        while not self._shutdown.is_set():
+            try:
+                packets = self._rxBatch.recv()
+            except socket.error:
+                return
+            cleaned = []
+            for raw_khanda_packet in packets:
+                raw_khanda_packet = clean_packet(raw_khanda_packet.tobytes())
+                if raw_khanda_packet:
+                    cleaned.append(raw_khanda_packet)
+            if not cleaned:
+                continue
+            #One console write per batch rather than one per packet, print() writes and flushes each argument separately
+            console = getattr(sys.stdout,"buffer",None)
+            if console is None:
+                for raw_khanda_packet in cleaned:
+                    print(raw_khanda_packet)
+            else:
+                console.write(b"\n".join(cleaned) + b"\n")
+                console.flush()
+            for raw_khanda_packet in cleaned:
+                self.QueuePacket(raw_khanda_packet)
+
+    def pinRxThread(self):
+        """Pins the calling thread to the CPUs local to nic_iface and sets SCHED_FIFO priority RX_PRIORITY
+        Keeps the receive path on the NUMA node that owns the NIC's RX ring. Does nothing if nic_iface is not set
+        or the platform lacks sched_setaffinity, SCHED_FIFO requires CAP_SYS_NICE.
+        Args:
+            None
+        Returns:
+            None
+        Raises:
+            None
+        """
+        if self.nic_iface is None or not hasattr(os,"sched_setaffinity"):
+            return
+        try:
+            with open("/sys/class/net/%s/device/local_cpulist" % self.nic_iface) as cpulist:
+                cpus = parse_cpulist(cpulist.read())
+            #pid 0 is the calling thread, not the whole process
+            os.sched_setaffinity(0,cpus)
+        except (OSError,ValueError):
+            sys.stderr.write("Unable to pin Rx thread to %s CPUs!" % self.nic_iface)
+        try:
+            os.sched_setscheduler(0,os.SCHED_FIFO,os.sched_param(RX_PRIORITY))
+        except (OSError,AttributeError):
+            sys.stderr.write("Unable to set Rx thread priority!")
 
     def TxWorker(self):
-        """Worker thread function that retrieves data from the Tx message queue and sends the packet via a UDP socket
+        """Worker thread function that drains up to TX_BATCH packets from the Tx message queue and sends them via a UDP socket
         Args:
             None
         Returns:
@@ -312,18 +481,140 @@ class khandaServer:
         Raises:
             None
         """
-        while True:
-            writeable = [self.sock]
-            read,write,exception = select.select([],writeable,[],0)
-            if self.TxQueue.empty() is False and len(writeable_socket):
-                Txpacket = self.TxQueue.get()
-                for writeable_socket in write:
-                    self.sock.sendto(Txpacket.data,(Txpacket.recipient,self.port))
+        stop = False
+        while not stop and not self._shutdown.is_set():
+            Txpacket = self.TxQueue.get()
+            if Txpacket is None:
+                break
+            batch = [Txpacket]
+            while len(batch) < TX_BATCH:
+                try:
+                    Txpacket = self.TxQueue.get_nowait()
+                except IndexError:
+                    break
+                if Txpacket is None:
+                    stop = True
+                    break
+                batch.append(Txpacket)
+            try:
+                self._txBatch.send([(packet.data,self._addr(packet.recipient)) for packet in batch])
+            except socket.error:
+                sys.stderr.write("Unable to send packets!")
+            if self.serialPorts:
+                #One write per port for the whole batch
+                serial_data = b"".join([Txpacket.data for Txpacket in batch])
                 for port in self.serialPorts:
-                    port.write(TxPacket.data)
-                self.TxQueue.task_done()
-            else:
-                continue
+                    try:
+                        port.write(serial_data)
+                    except serial.SerialException:
+                        sys.stderr.write("Unable to write to serial port!")
+
+    def _addr(self,ip):
+        """Returns the (IP,port) destination tuple for a recipient, built once per recipient
+        Args:
+            ip : string, recipient IP address
+        Returns:
+            (ip,port) tuple
+        Raises:
+            None
+        """
+        addr = self._addr_cache.get(ip)
+        if addr is None:
+            addr = self._addr_cache[ip] = (ip,self.port)
+        return addr
+
+    def LogPacket(self,RxPacket):
+        """Appends a type,payload,timestamp line for the packet to the logfile buffer, LogFlushWorker writes it to disk
+        Args:
+            RxPacket : khanda_message, packet to log
+        Returns:
+            None
+        Raises:
+            Error if the logfile is closed
+        """
+        self.logfile.write(b"%b,%b,%b\r\n" % (str(RxPacket.type).encode('utf8'),str(RxPacket.payload).encode('utf8'),
+                                                str(RxPacket.timestamp).encode('utf8')))
+
+    def LogFlushWorker(self):
+        """Worker thread function that flushes the logfile buffer every LOG_FLUSH_INTERVAL seconds until shutdown
+        Args:
+            None
+        Returns:
+            None
+        Raises:
+            None
+        """
+        while not self._shutdown.wait(LOG_FLUSH_INTERVAL):
+            try:
+                self.logfile.flush()
+            except (OSError,ValueError):
+                sys.stderr.write("Unable to flush logfile!")
+                return
+
+    def _handleEvent(self,RxPacket):
+        """Default parser handler for EVENT packets, places the event in the logfile
+        Args:
+            RxPacket : khanda_message, EVENT packet
+        Returns:
+            None
+        Raises:
+            None
+        """
+        self.LogPacket(RxPacket)
+
+    def _handleLED(self,RxPacket):
+        """Default parser handler for LED packets, queues the matching LED command and logs the packet
+        Args:
+            RxPacket : khanda_message, LED packet
+        Returns:
+            None
+        Raises:
+            None
+        """
+        LED_Resp = _LED_RESP.get(RxPacket.payload)
+        if LED_Resp is not None:
+            khanda_resp_wrapper = khanda_TxWrapper(LED_RESP_IP,LED_Resp % time.time())
+            self.TxQueue.put(khanda_resp_wrapper)
+        self.LogPacket(RxPacket)
+
+    def _handleHealth(self,RxPacket):
+        """Default parser handler for HEALTH packets, reports unhealthy devices
+        Args:
+            RxPacket : khanda_message, HEALTH packet
+        Returns:
+            None
+        Raises:
+            None
+        """
+        if RxPacket.payload == "UNHEALTHY":
+            sys.stderr.write("DEVICE ERROR RESTART")
+
+    def _handleDevice(self,RxPacket):
+        """Default parser handler for DEVICE packets, records the device and acknowledges it
+        Args:
+            RxPacket : khanda_message, DEVICE packet with a "type+IP" payload
+        Returns:
+            None
+        Raises:
+            None
+        """
+        type,sep,IP = str(RxPacket.payload).partition("+")
+        try:
+            #inet_pton only accepts a full dotted quad, inet_aton would also take "0", "0x7f.1" or "1.2.3.4 junk"
+            socket.inet_pton(socket.AF_INET,IP)
+        except (socket.error,ValueError):
+            sep = ""
+        if not sep or not type:
+            sys.stderr.write("Invalid DEVICE payload %r!" % (RxPacket.payload,))
+            return
+        self.Attached_Devices[IP] = type
+        khanda_Resp = khanda_message("ACKDEV","SUCCESS",IP,TIMESTAMP_FMT % time.time())
+        khanda_resp_wrapper = khanda_TxWrapper(IP,KhandaMSGDumps(khanda_Resp))
+        self.TxQueue.put(khanda_resp_wrapper)
+
+    #Packet type -> default parser handler, one dict lookup per packet
+    _handlers = {"EVENT" : _handleEvent, "LED" : _handleLED,
+                 "HEALTH" : _handleHealth, "DEVICE" : _handleDevice}
 
     def CMDWorker(self,CMDParser=None):
         """Worker thread function that retrieves data from the Rx message queue and performs specified operation
@@ -335,57 +626,68 @@ class khandaServer:
             None
         """
         if CMDParser is None:
-            while True:
-                if self.RxQueue.empty() is False:
-                    RxPacket = self.RxQueue.get()
-                    if RxPacket.type == "EVENT":
-                        """Place Event in Event file/queue"""
-                        #print("Event Detected")
-                        logfile = open("logfile.txt","a")
-                        FileWrite_Buff = str(RxPacket.type) + "," + str(RxPacket.payload) + "," + str(RxPacket.timestamp) + "\r\n"
-                        logfile.write(str(FileWrite_Buff))
-                        logfile.close()
-                    if RxPacket.type == "LED":
-                        if RxPacket.payload == "RED" or RxPacket.payload == "REDOFF":
-                            khanda_Resp = khanda_message("CMD","LED+RED","224.1.1.1",str(time.time()))
-                            khanda_resp_wrapper = khanda_TxWrapper("10.0.0.120",json.dumps(khanda_Resp,cls=JSONEncoder))
-                        elif RxPacket.payload == "GREEN" or RxPacket.payload == "GREENOFF":
-                            khanda_Resp = khanda_message("CMD","LED+GREEN","224.1.1.1",str(time.time()))
-                            khanda_resp_wrapper = khanda_TxWrapper("10.0.0.120",json.dumps(khanda_Resp,cls=JSONEncoder))
-                        elif RxPacket.payload == "BLUE" or RxPacket.payload == "BLUEOFF":
-                            khanda_Resp = khanda_message("CMD","LED+BLUE","224.1.1.1",str(time.time()))
-                            khanda_resp_wrapper = khanda_TxWrapper("10.0.0.120",json.dumps(khanda_Resp,cls=JSONEncoder))
-                        self.TxQueue.put(khanda_resp_wrapper)
-                        logfile = open("logfile.txt","a")
-                        FileWrite_Buff = str(RxPacket.type) + "," + str(RxPacket.payload) + "," + str(RxPacket.timestamp) + "\r\n"
-                        logfile.write(str(FileWrite_Buff))
-                        logfile.close()
-                    if RxPacket.type == "HEALTH":
-                        if RxPacket.payload == "UNHEALTHY":
-                            sys.stderr.write("DEVICE ERROR RESTART")
-                    if RxPacket.type == "DEVICE":
-                        type,IP = RxPacket.data.split("+")
-                        device = []
-                        device.append(type)
-                        device.append(IP)
-                        self.Attached_Devices.append(device)
-                        khanda_Resp = khanda_message("ACKDEV","SUCCESS",IP,str(time.time()))
-                        khanda_resp_wrapper = khanda_TxWrapper(IP,json.dumps(khanda_Resp,cls=JSONEncoder))
-                        self.TxQueue.put(khanda_resp_wrapper)
-                        del device
-                    self.RxQueue.task_done()
-                else:
-                    continue
+            while not self._shutdown.is_set():
+                RxPacket = self.RxQueue.get()
+                if RxPacket is None:
+                    break
+                handler = self._handlers.get(RxPacket.type)
+                if handler is not None:
+                    try:
+                        handler(self,RxPacket)
+                    except Exception:
+                        sys.stderr.write("Unable to process %s packet!" % RxPacket.type)
         else:
+            while not self._shutdown.is_set():
+                RxPacket = self.RxQueue.get()
+                if RxPacket is None:
+                    break
+                #A failing parser call drops that packet only, an exiting worker would leave RxWorker blocked on a full RxQueue
+                try:
+                    khanda_resp_wrapper = CMDParser(RxPacket)
+                except Exception:
+                    sys.stderr.write("Invalid Command Parser!")
+                    continue
+                if khanda_resp_wrapper is None:
+                    continue
+                else:
+                    self.TxQueue.put(khanda_resp_wrapper)
+
+    def CMDPoolWorker(self,CMDParser):
+        """Worker thread function that retrieves data from the Rx message queue and runs the custom parser on it in cmdPool
+        Args:
+            CMDParser : function, module-level custom parser function, called with the khanda_message in a pool process
+        Returns:
+            None
+        Raises:
+            None
+        """
+        while not self._shutdown.is_set():
+            RxPacket = self.RxQueue.get()
+            if RxPacket is None:
+                break
+            self._cmdSlots.acquire()
             try:
-                while True:
-                    if self.RxQueue.empty() is False:
-                        RxPacket = self.RxQueue.get()
-                        khanda_resp_wrapper = CMDParser(RxPacket)
-                        if khanda_resp_wrapper is None:
-                            continue
-                        else:
-                            self.TxQueue.put(khanda_resp_wrapper)
-                        self.RxQueue.task_done()
-            except:
+                future = self.cmdPool.submit(CMDParser,RxPacket)
+            except Exception:
+                self._cmdSlots.release()
                 sys.stderr.write("Invalid Command Parser!")
+                return
+            future.add_done_callback(self._queueParserResult)
+
+    def _queueParserResult(self,future):
+        """Places the response of a custom parser call run in cmdPool into the TxQueue
+        Args:
+            future : Future, completed CMDParser call
+        Returns:
+            None
+        Raises:
+            None
+        """
+        try:
+            khanda_resp_wrapper = future.result()
+            if khanda_resp_wrapper is not None:
+                self.TxQueue.put(khanda_resp_wrapper)
+        except Exception:
+            sys.stderr.write("Invalid Command Parser!")
+        finally:
+            self._cmdSlots.release()
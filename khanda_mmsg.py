@@ -0,0 +1,244 @@
+#System Imports
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+import sys
+
+MSG_WAITFORONE = 0x10000
+#Non-blocking receive flag for the fallback drain, 0 where the platform has none (Windows)
+MSG_DONTWAIT = getattr(socket,"MSG_DONTWAIT",0)
+SOCKADDR_IN_LEN = 16
+
+class iovec(ctypes.Structure):
+    """struct iovec from <sys/uio.h>, iov_base is typed char * so bytes can be assigned without a cast"""
+    _fields_ = [("iov_base",ctypes.c_char_p),
+                ("iov_len",ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+    """struct msghdr from <sys/socket.h>"""
+    _fields_ = [("msg_name",ctypes.c_void_p),
+                ("msg_namelen",ctypes.c_uint32),
+                ("msg_iov",ctypes.POINTER(iovec)),
+                ("msg_iovlen",ctypes.c_size_t),
+                ("msg_control",ctypes.c_void_p),
+                ("msg_controllen",ctypes.c_size_t),
+                ("msg_flags",ctypes.c_int)]
+
+class mmsghdr(ctypes.Structure):
+    """struct mmsghdr from <sys/socket.h>"""
+    _fields_ = [("msg_hdr",msghdr),
+                ("msg_len",ctypes.c_uint)]
+
+def _load_libc():
+    """Loads the C library if it exports recvmmsg/sendmmsg (Linux only)
+    Args:
+        None
+    Returns:
+        libc: CDLL handle, or None if recvmmsg/sendmmsg are unavailable on this platform
+    Raises:
+        None
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"),use_errno=True)
+    except (OSError,TypeError):
+        return None
+    if not hasattr(libc,"recvmmsg") or not hasattr(libc,"sendmmsg"):
+        return None
+    libc.recvmmsg.argtypes = [ctypes.c_int,ctypes.POINTER(mmsghdr),ctypes.c_uint,ctypes.c_int,ctypes.c_void_p]
+    libc.recvmmsg.restype = ctypes.c_int
+    libc.sendmmsg.argtypes = [ctypes.c_int,ctypes.POINTER(mmsghdr),ctypes.c_uint,ctypes.c_int]
+    libc.sendmmsg.restype = ctypes.c_int
+    return libc
+
+libc = _load_libc()
+
+class khanda_RxBatch:
+    """
+    This is a class for receiving a batch of UDP datagrams per system call using recvmmsg(2)
+
+    Attributes:
+        sock (socket): UDP socket to receive from
+        count (int): maximum number of datagrams returned by one recv call
+        size (int): maximum datagram size in bytes
+        _buf (bytearray): receive buffer for count datagrams, reused by every recv call
+        _view (memoryview): view of _buf that packets are sliced from without copying
+    Methods:
+        __init__: Preallocates the datagram buffers and mmsghdr array
+        recv: Blocks until at least one datagram is available and returns every queued datagram up to count
+    """
+    def __init__(self,sock,count=32,size=512):
+        """Initializes the khanda_RxBatch object, all buffers are allocated once here so recv does not allocate
+        Args:
+            sock : socket, bound UDP socket
+            count : int, maximum datagrams per system call, default: 32
+            size : int, maximum datagram size in bytes, default: 512
+        Returns:
+            None
+        Raises:
+            None
+        """
+        self.sock = sock
+        self.count = count
+        self.size = size
+        self._buf = bytearray(count * size)
+        self._view = memoryview(self._buf)
+        if libc is None:
+            return
+        self._iovecs = (iovec * count)()
+        self._msgs = (mmsghdr * count)()
+        base = ctypes.addressof((ctypes.c_char * len(self._buf)).from_buffer(self._buf))
+        for i in range(count):
+            self._iovecs[i].iov_base = base + i * size
+            self._iovecs[i].iov_len = size
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+
+    def recv(self):
+        """Receives up to count datagrams, where recvmmsg is unavailable blocks for one datagram with recv_into
+        and then drains whatever else is queued with non-blocking recv_into calls
+        Args:
+            None
+        Returns:
+            packets : list of memoryview datagram payloads (empty if the socket was shut down),
+                      the views share the receive buffer and are only valid until the next recv call
+        Raises:
+            socket.error if the receive fails
+        """
+        if libc is None:
+            n = self.sock.recv_into(self._buf,self.size)
+            packets = [self._view[:n]]
+            if not MSG_DONTWAIT or n == 0:
+                return packets
+            for i in range(1,self.count):
+                try:
+                    n = self.sock.recv_into(self._view[i * self.size:],self.size,MSG_DONTWAIT)
+                except (BlockingIOError,InterruptedError):
+                    break
+                packets.append(self._view[i * self.size:i * self.size + n])
+            return packets
+        while True:
+            n = libc.recvmmsg(self.sock.fileno(),self._msgs,self.count,MSG_WAITFORONE,None)
+            if n >= 0:
+                break
+            err = ctypes.get_errno()
+            if err != errno.EINTR:
+                raise socket.error(err,os.strerror(err))
+        return [self._view[i * self.size:i * self.size + self._msgs[i].msg_len] for i in range(n)]
+
+class khanda_TxBatch:
+    """
+    This is a class for sending a batch of UDP datagrams per system call using sendmmsg(2)
+
+    Attributes:
+        sock (socket): UDP socket to send from
+        count (int): maximum number of datagrams sent by one system call
+    Methods:
+        __init__: Preallocates the mmsghdr array
+        send: Sends a list of (data,address) pairs
+        _sendto: Sends a list of (data,address) pairs one sendto call each
+    """
+    def __init__(self,sock,count=32):
+        """Initializes the khanda_TxBatch object
+        Args:
+            sock : socket, UDP socket
+            count : int, maximum datagrams per system call, default: 32
+        Returns:
+            None
+        Raises:
+            None
+        """
+        self.sock = sock
+        self.count = count
+        self._enabled = libc is not None
+        self._addrs = {}
+        if not self._enabled:
+            return
+        self._iovecs = (iovec * count)()
+        self._msgs = (mmsghdr * count)()
+        for i in range(count):
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+            self._msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN_LEN
+
+    def _sockaddr(self,address):
+        """Returns the address of a cached struct sockaddr_in for an (ip,port) pair
+        Args:
+            address : tuple, (ip,port) destination
+        Returns:
+            sockaddr : int, address of the packed sockaddr_in, valid for the life of this object
+        Raises:
+            socket.error if ip is not a valid IPv4 address
+        """
+        cached = self._addrs.get(address)
+        if cached is None:
+            packed = struct.pack("=H",socket.AF_INET) + struct.pack("!H",address[1]) + socket.inet_aton(address[0]) + b"\0" * 8
+            buf = ctypes.create_string_buffer(packed,len(packed))
+            cached = (buf,ctypes.addressof(buf))
+            self._addrs[address] = cached
+        return cached[1]
+
+    def send(self,packets):
+        """Sends every packet, count datagrams per sendmmsg call, falls back to sendto where sendmmsg is unavailable
+        A packet whose destination cannot be resolved or whose send fails is reported and skipped, the rest are still sent
+        Args:
+            packets : list of (data,address) pairs, data is bytes-like and address is an (ip,port) tuple
+        Returns:
+            None
+        Raises:
+            None
+        """
+        if not self._enabled:
+            self._sendto(packets)
+            return
+        pending = []
+        for data,address in packets:
+            #iov_base only takes bytes, bytearray/memoryview payloads are copied once here
+            if not isinstance(data,bytes):
+                try:
+                    data = bytes(memoryview(data))
+                except (TypeError,ValueError):
+                    sys.stderr.write("Invalid payload %r for %r!" % (type(data).__name__,address))
+                    continue
+            try:
+                pending.append((data,address,self._sockaddr(address)))
+            except (socket.error,struct.error,TypeError,ValueError):
+                sys.stderr.write("Invalid destination %r!" % (address,))
+        start = 0
+        while start < len(pending):
+            chunk = pending[start:start + self.count]
+            for i,(data,address,sockaddr) in enumerate(chunk):
+                self._iovecs[i].iov_base = data
+                self._iovecs[i].iov_len = len(data)
+                self._msgs[i].msg_hdr.msg_name = sockaddr
+            n = libc.sendmmsg(self.sock.fileno(),self._msgs,len(chunk),0)
+            if n < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                if err == errno.ENOSYS:
+                    self._enabled = False
+                    self._sendto([(data,address) for data,address,sockaddr in pending[start:]])
+                    return
+                #sendmmsg reports the error of the first unsent message, drop only that one
+                sys.stderr.write("Unable to send to %r: %s!" % (chunk[0][1],os.strerror(err)))
+                start += 1
+                continue
+            start += n
+
+    def _sendto(self,packets):
+        """Sends packets one sendto call each, reporting and skipping any that fail
+        Args:
+            packets : list of (data,address) pairs
+        Returns:
+            None
+        Raises:
+            None
+        """
+        for data,address in packets:
+            try:
+                self.sock.sendto(data,address)
+            except (socket.error,TypeError,ValueError,OverflowError) as e:
+                sys.stderr.write("Unable to send to %r: %s!" % (address,e))
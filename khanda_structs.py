@@ -1,5 +1,16 @@
 #System Imports
 import json
+import threading
+from collections import deque
+#3rd Party Imports
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 class khanda_message(object):
     """
@@ -14,6 +25,9 @@ class khanda_message(object):
         __init__: Creates khanda_message object
         __json__: Object JSON decoder function
     """
+    #One object is created per packet, slots avoid a per-instance __dict__
+    __slots__ = ('type','payload','recipient','timestamp')
+
     def __init__(self,type,payload,recipient,timestamp):
         """Initializes the khanda_message object
         Args:
@@ -47,13 +61,17 @@ class khanda_TxWrapper:
     """
     This is a class for wrapping decoded khanda_message object for tranmission worker
     Attributes:
-        data (string): JSON serialized khanda_message object
+        data (bytes): JSON serialized khanda_message object, UTF-8 encoded for the socket and serial ports
         recipient (string): recipient IP address
     Methods:
         __init__: create wrapper object
     """
+    __slots__ = ('recipient','data')
+
     def __init__(self,recipient,JSONMSG):
         self.recipient = recipient
+        if isinstance(JSONMSG,str):
+            JSONMSG = JSONMSG.encode('utf8')
         self.data = JSONMSG
 
 class JSONEncoder(json.JSONEncoder):
@@ -70,6 +88,9 @@ class JSONEncoder(json.JSONEncoder):
         Raises:
             Error if object does not follow expected JSON formatting
         """
+        #khanda_message is the only type the server encodes, test for it before falling back to reflection
+        if isinstance(obj,khanda_message):
+            return obj.__json__()
         if hasattr(obj,'__json__'):
             return obj.__json__()
         return json.JSONEncoder.default(self,obj)
@@ -85,3 +106,156 @@ def KhandaMSGDecoder(obj):
     """
     return khanda_message(obj['type'],obj['payload'],
                          obj['recipient'],obj['timestamp'])
+
+def KhandaMSGIsPacked(raw):
+    """Sniffs the first byte of a packet to tell msgpack framing from legacy JSON
+    A msgpack khanda_message is a map (0x80-0x8f fixmap, 0xde map16, 0xdf map32), JSON starts with '{' or whitespace
+    Args:
+        raw : bytes, non-empty raw packet
+    Returns:
+        True if the packet is msgpack encoded
+    Raises:
+        None
+    """
+    first = raw[0]
+    return (first & 0xF0) == 0x80 or first == 0xDE or first == 0xDF
+
+def KhandaMSGParse(raw):
+    """Parses a raw packet into a plain dict, msgpack packets are unpacked in C,
+    JSON packets use orjson when it is installed
+    Args:
+        raw : bytes, msgpack or JSON encoded khanda_message
+    Returns:
+        dict with type, payload, recipient and timestamp keys
+    Raises:
+        Error if data is not in proper msgpack or JSON format
+    """
+    if KhandaMSGIsPacked(raw):
+        if msgpack is None:
+            raise ValueError("msgpack packet received but msgpack is not installed")
+        return msgpack.unpackb(raw,raw=False)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw,strict=False)
+
+def KhandaMSGDumps(msg):
+    """Serializes a khanda_message object into JSON bytes ready for the socket and serial ports,
+    uses orjson when it is installed
+    Args:
+        msg : khanda_message object
+    Returns:
+        bytes, UTF-8 encoded JSON
+    Raises:
+        Error if a field is not JSON serializable
+    """
+    if orjson is not None:
+        return orjson.dumps(msg.__json__())
+    return json.dumps(msg.__json__(),separators=(',',':')).encode('utf8')
+
+
+class khanda_BoundedQueue(object):
+    """
+    This is a bounded queue for passing objects between worker threads, a slow consumer pushes back on its producers
+    instead of growing memory. The deque is private and every access goes through the methods below, so the capacity
+    check, append/popleft and wakeups all happen under one lock and any number of producers can share the queue
+
+    Attributes:
+        maxsize (int): maximum number of queued objects before put blocks, 0 for unbounded
+        _queue (deque): queued objects, oldest first
+        _lock (Lock): guards _queue and _closed
+        _notEmpty (Condition): notified by put, waited on by get while the queue is empty
+        _notFull (Condition): notified by get/get_nowait, waited on by put while the queue is full
+        _closed (bool): set by close, put no longer blocks once the queue is closed
+    Methods:
+        __init__: Creates an empty queue
+        __len__: Number of queued objects
+        put: Append an object and wake the consumer, blocking while the queue is full
+        get: Remove and return the oldest object, blocking while the queue is empty
+        get_nowait: Remove and return the oldest object without blocking, wakes a blocked producer
+        close: Stop put from blocking so producers can exit on shutdown
+    """
+    def __init__(self,maxsize=0):
+        """Initializes the khanda_BoundedQueue object
+        Args:
+            maxsize : int, maximum number of queued objects before put blocks, default: unbounded
+        Returns:
+            None
+        Raises:
+            None
+        """
+        self.maxsize = maxsize
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._notEmpty = threading.Condition(self._lock)
+        self._notFull = threading.Condition(self._lock)
+        self._closed = False
+
+    def __len__(self):
+        """Returns the number of queued objects, only a snapshot while other threads use the queue
+        Args:
+            None
+        Returns:
+            int : number of queued objects
+        Raises:
+            None
+        """
+        with self._lock:
+            return len(self._queue)
+
+    def put(self,obj):
+        """Appends obj to the queue and wakes the consumer, blocks while the queue holds maxsize objects
+        Args:
+            obj : object to queue
+        Returns:
+            None
+        Raises:
+            None
+        """
+        with self._lock:
+            while self.maxsize and len(self._queue) >= self.maxsize and not self._closed:
+                self._notFull.wait()
+            self._queue.append(obj)
+            self._notEmpty.notify()
+
+    def get(self):
+        """Removes and returns the oldest object, blocks until one is available
+        Args:
+            None
+        Returns:
+            obj : oldest queued object
+        Raises:
+            None
+        """
+        with self._lock:
+            while not self._queue:
+                self._notEmpty.wait()
+            obj = self._queue.popleft()
+            self._notFull.notify()
+            return obj
+
+    def get_nowait(self):
+        """Removes and returns the oldest object without blocking, wakes a producer blocked in put
+        Args:
+            None
+        Returns:
+            obj : oldest queued object
+        Raises:
+            IndexError if the queue is empty
+        """
+        with self._lock:
+            obj = self._queue.popleft()
+            self._notFull.notify()
+            return obj
+
+    def close(self):
+        """Closes the queue for back-pressure, blocked and future put calls append without waiting
+        Args:
+            None
+        Returns:
+            None
+        Raises:
+            None
+        """
+        with self._lock:
+            self._closed = True
+            self._notFull.notify_all()